@@ -0,0 +1,429 @@
+"""
+Model loading and frame capture shared by run_agent.py and play_the_game.py.
+
+The live agents prefer the models written by convert_models.py, ONNX (with
+onnxruntime installed) over TFLite, and fall back to the original .keras files
+when those haven't been converted yet. Either way the loaded models are plain
+callables: float batch in, float array out. The brain is wrapped in a
+StreamingBrain, which takes one latent vector per frame instead of a whole
+sequence, and the encoder in a CachedEncoder, which skips frames that haven't
+changed.
+
+FramePipeline grabs and preprocesses frames on background threads, so the
+agent loop only runs the models, presses keys and draws. quit_on_key watches
+for the quit key the same way.
+"""
+import os
+import queue
+import sys
+import threading
+from importlib.util import find_spec
+from pathlib import Path
+
+import cv2
+import mss
+import numpy as np
+
+ENCODER_KERAS = 'cuphead_encoder.keras'
+BRAIN_KERAS = 'cuphead_brain.keras'
+# Converted models, see streaming_models(): the encoder with the GRU's input
+# projection fused on, and the recurrent part of the brain
+ENCODER_TFLITE = 'cuphead_encoder_proj.tflite'
+BRAIN_GRU_TFLITE = 'cuphead_brain_gru.tflite'
+ENCODER_ONNX = 'cuphead_encoder_proj.onnx'
+BRAIN_GRU_ONNX = 'cuphead_brain_gru.onnx'
+
+# Tried in order, the first one this onnxruntime build has wins. The encoder CNN goes to a GPU
+# when there is one; the small GRU would lose more to transfers than it gains, so it stays on the CPU.
+ONNX_ENCODER_PROVIDERS = ['CUDAExecutionProvider', 'OpenVINOExecutionProvider', 'DmlExecutionProvider',
+                          'CPUExecutionProvider']
+ONNX_BRAIN_PROVIDERS = ['CPUExecutionProvider']
+
+# TFLite delegate libraries tried for the encoder, in order; plain CPU (XNNPACK) is the fallback
+if sys.platform == 'darwin':
+    TFLITE_DELEGATES = ['libtensorflowlite_coreml_delegate.dylib', 'libtensorflowlite_gpu_delegate.dylib']
+elif sys.platform == 'win32':
+    TFLITE_DELEGATES = ['tensorflowlite_gpu_delegate.dll']
+else:
+    TFLITE_DELEGATES = ['libtensorflowlite_gpu_delegate.so']
+
+# Sum of absolute differences (in 0-1 pixel units) below which a frame counts as a repeat
+DUPLICATE_THRESHOLD = 2.0
+
+
+def _tflite_interpreter_class():
+    # The standalone runtime is a much lighter import than full TensorFlow
+    try:
+        from tflite_runtime.interpreter import Interpreter, load_delegate
+    except ImportError:
+        import tensorflow as tf
+        Interpreter, load_delegate = tf.lite.Interpreter, tf.lite.experimental.load_delegate
+    return Interpreter, load_delegate
+
+
+class TFLiteModel:
+    """
+    A single-input, single-output .tflite model.
+
+    Tensor indices and quantization parameters are looked up once here, and
+    inputs and outputs go through views of the interpreter's own buffers
+    (tensor()) rather than set_tensor / get_tensor, which copy. INT8 models
+    are quantized straight into the input buffer and dequantized out of the
+    output buffer, so callers always see floats.
+
+    delegates names delegate libraries to try in order; the first one that
+    loads and accepts the model is used, otherwise it runs on the CPU
+    (XNNPACK, built into current runtimes).
+    """
+
+    def __init__(self, model_path, num_threads=None, delegates=()):
+        Interpreter, load_delegate = _tflite_interpreter_class()
+        num_threads = num_threads or os.cpu_count()
+        self.interpreter = None
+        self.delegate = None
+        for library in delegates:
+            try:
+                self.interpreter = Interpreter(model_path=str(model_path), num_threads=num_threads,
+                                               experimental_delegates=[load_delegate(library)])
+                self.interpreter.allocate_tensors()
+                self.delegate = library
+                break
+            except (ValueError, OSError, RuntimeError):
+                self.interpreter = None
+        if self.interpreter is None:
+            self.interpreter = Interpreter(model_path=str(model_path), num_threads=num_threads)
+            self.interpreter.allocate_tensors()
+
+        inp = self.interpreter.get_input_details()[0]
+        out = self.interpreter.get_output_details()[0]
+        self._in_dtype = inp['dtype']
+        self._out_dtype = out['dtype']
+        self._in_scale, self._in_zero = inp['quantization']
+        self._out_scale, self._out_zero = out['quantization']
+        self.input_shape = tuple(inp['shape'])
+        if self._in_dtype == np.int8:
+            # Quantizing multiplies by the reciprocal scale into this float32 scratch buffer
+            self._in_inv_scale = np.float32(1.0 / self._in_scale)
+            self._in_scratch = np.empty(self.input_shape, np.float32)
+        # Only the accessors are kept: invoke() refuses to run while a view is alive
+        self._input = self.interpreter.tensor(inp['index'])
+        self._output = self.interpreter.tensor(out['index'])
+
+    def __call__(self, x):
+        if self._in_dtype == np.int8:
+            q = self._in_scratch
+            np.multiply(x, self._in_inv_scale, out=q)
+            q += self._in_zero
+            np.rint(q, out=q)
+            np.clip(q, -128, 127, out=q)
+            self._input()[...] = q
+        else:
+            self._input()[...] = x
+        self.interpreter.invoke()
+        # The output buffer is overwritten by the next invoke, so callers get their own array
+        if self._out_dtype == np.int8:
+            return (self._output().astype(np.float32) - self._out_zero) * self._out_scale
+        return self._output().copy()
+
+
+class ONNXModel:
+    """
+    A single-input, single-output .onnx model on the first of providers that
+    this onnxruntime build has.
+
+    Input and output names are looked up once here. Quantized models keep
+    float inputs and outputs (QDQ format), so no conversion is needed.
+    """
+
+    def __init__(self, model_path, providers):
+        import onnxruntime as ort
+        available = ort.get_available_providers()
+        self.session = ort.InferenceSession(str(model_path),
+                                            providers=[p for p in providers if p in available])
+        self._in_name = self.session.get_inputs()[0].name
+        self._out_names = [self.session.get_outputs()[0].name]
+
+    def __call__(self, x):
+        return self.session.run(self._out_names, {self._in_name: np.asarray(x, dtype=np.float32)})[0]
+
+
+def _onnxruntime_available():
+    # find_spec only asks the import system where the package is, without running it
+    return find_spec('onnxruntime') is not None
+
+
+def streaming_models(encoder, brain):
+    """
+    Rebuilds the encoder and GRU brain as (encode, recur) Keras models.
+
+    The brain is split after the GRU's input projection (x @ kernel + input
+    bias), by far the biggest matmul in it, and that projection is fused onto
+    the end of the encoder: encode maps a frame straight to what the GRU
+    consumes, in one graph. recur is the rest of the brain run on a sequence
+    of those projections: a GRU with an identity kernel followed by the
+    original dense head, so recur(encode(f_t) for each t) == brain(encoder(f)).
+    The projection of a frame never changes while it slides through the
+    window, so it only has to be computed once.
+    """
+    import tensorflow as tf
+
+    gru_idx, gru = next((i, l) for i, l in enumerate(brain.layers)
+                        if isinstance(l, tf.keras.layers.GRU))
+    kernel, recurrent_kernel, bias = gru.get_weights()
+    units = gru.units
+    seq_len, latent_dim = brain.input_shape[1], brain.input_shape[2]
+
+    frame = tf.keras.Input(encoder.input_shape[1:])
+    latent = tf.keras.layers.Reshape((latent_dim,))(encoder(frame))
+    project = tf.keras.layers.Dense(3 * units, name='gru_input_projection')
+    encode = tf.keras.Model(frame, project(latent))
+    project.set_weights([kernel, bias[0]])
+
+    seq = tf.keras.Input((seq_len, 3 * units))
+    step = tf.keras.layers.GRU(units, activation=gru.activation,
+                               recurrent_activation=gru.recurrent_activation,
+                               reset_after=True, name='gru_recurrent')
+    y = step(seq)
+    step.set_weights([np.eye(3 * units, dtype=np.float32), recurrent_kernel,
+                      np.stack([np.zeros_like(bias[0]), bias[1]])])
+    for layer in brain.layers[gru_idx + 1:]:
+        y = layer(y)
+    return encode, tf.keras.Model(seq, y)
+
+
+class CachedEncoder:
+    """
+    Skips the encoder on frames that are nearly identical to the last one
+    it encoded, and returns that frame's latent vector again instead.
+
+    Frames are compared by the sum of absolute differences of the model
+    input. The default threshold is about 500 gray levels over the whole
+    frame. Comparing against the last encoded frame, not the previous one,
+    keeps a slow drift from being skipped forever.
+    """
+
+    def __init__(self, encoder, threshold=DUPLICATE_THRESHOLD):
+        self.encoder = encoder
+        self.threshold = threshold
+        self._prev = None
+        self._latent = None
+
+    def __call__(self, frame):
+        gray = frame[0, :, :, 0]
+        if self._prev is not None and cv2.norm(gray, self._prev, cv2.NORM_L1) < self.threshold:
+            return self._latent
+        if self._prev is None:
+            self._prev = np.empty_like(gray)
+        np.copyto(self._prev, gray)
+        self._latent = self.encoder(frame)
+        return self._latent
+
+
+class StreamingBrain:
+    """
+    Runs the brain one frame at a time.
+
+    Each call takes the new frame's projected latent vector (the output of
+    the fused encoder, see streaming_models) and stores it in a ring of the
+    last seq_len; once the ring is full the recurrent part runs over it and
+    the action probabilities are returned (None until then). The ring is
+    stored twice back to back so the current window is always a contiguous
+    slice.
+
+    Once the whole window is made of repeats of the same latent object (see
+    CachedEncoder) the last probabilities are returned without running
+    anything.
+    """
+
+    def __init__(self, recur, seq_len):
+        self.recur = recur
+        self.seq_len = seq_len
+        self._ring = None  # sized from the first projection
+        self.reset()
+
+    def reset(self):
+        self._count = 0
+        self._last_latent = None
+        self._repeats = 0
+        self._probs = None
+
+    def __call__(self, latent):
+        if latent is self._last_latent:
+            self._repeats += 1
+            if self._repeats >= self.seq_len and self._probs is not None:
+                return self._probs
+        else:
+            self._last_latent = latent
+            self._repeats = 0
+        if self._ring is None:
+            self._ring = np.empty((1, 2 * self.seq_len, latent.size), np.float32)
+        i = self._count % self.seq_len
+        self._ring[0, i] = self._ring[0, i + self.seq_len] = latent.reshape(-1)
+        self._count += 1
+        if self._count < self.seq_len:
+            return None
+        self._probs = self.recur(self._ring[:, i + 1:i + 1 + self.seq_len])[0]
+        return self._probs
+
+
+def load_models(seq_len):
+    """Returns (encoder, brain) callables, ONNX or TFLite if converted, otherwise Keras."""
+    if Path(ENCODER_ONNX).exists() and Path(BRAIN_GRU_ONNX).exists() and _onnxruntime_available():
+        encoder = ONNXModel(ENCODER_ONNX, ONNX_ENCODER_PROVIDERS)
+        brain = ONNXModel(BRAIN_GRU_ONNX, ONNX_BRAIN_PROVIDERS)
+        print(f"Using ONNX models ({ENCODER_ONNX} on {encoder.session.get_providers()[0]}, "
+              f"{BRAIN_GRU_ONNX} on {brain.session.get_providers()[0]}).")
+        return CachedEncoder(encoder), StreamingBrain(brain, seq_len)
+
+    if Path(ENCODER_TFLITE).exists() and Path(BRAIN_GRU_TFLITE).exists():
+        # Only the convolutional encoder goes to a delegate; the small GRU is fastest on the CPU
+        encoder = TFLiteModel(ENCODER_TFLITE, delegates=TFLITE_DELEGATES)
+        print(f"Using TFLite models ({ENCODER_TFLITE}, {BRAIN_GRU_TFLITE}), "
+              f"encoder on {encoder.delegate or 'CPU'}.")
+        return CachedEncoder(encoder), StreamingBrain(TFLiteModel(BRAIN_GRU_TFLITE), seq_len)
+
+    print("TFLite models not found, falling back to Keras (run convert_models.py for faster inference).")
+    from tensorflow.keras.models import load_model
+    encode, recur = streaming_models(load_model(ENCODER_KERAS), load_model(BRAIN_KERAS))
+    return (CachedEncoder(lambda x: encode.predict(x, verbose=0)),
+            StreamingBrain(lambda x: recur.predict(x, verbose=0), seq_len))
+
+
+def quit_on_key(char='q'):
+    """
+    Returns a threading.Event that is set once char is pressed.
+
+    A pynput listener thread watches the keyboard, so the agent loop only has
+    to check the event instead of polling cv2.waitKey every frame.
+    """
+    from pynput.keyboard import KeyCode, Listener
+
+    pressed = threading.Event()
+    target = KeyCode.from_char(char)
+
+    def on_press(key):
+        if key == target:
+            pressed.set()
+            return False  # stops the listener
+
+    Listener(on_press=on_press).start()
+    return pressed
+
+
+# gray level -> model input, computed exactly like training's float32 `/ 255.0`
+NORMALIZE_LUT = np.arange(256, dtype=np.float32) / np.float32(255.0)
+
+
+class Preprocessor:
+    """
+    BGRA grab -> (1, H, W, 1) float32 model input, same as in training
+    (gray, resize, / 255).
+
+    Every intermediate is preallocated and OpenCV writes straight into it.
+    The / 255 is a lookup in NORMALIZE_LUT (1 KB, always in cache) rather
+    than a multiply. The resize keeps cv2's default INTER_LINEAR, since that
+    is what the models were trained on. Outputs rotate through pool_size
+    buffers, so a returned frame stays valid until pool_size more have been
+    produced.
+    """
+
+    def __init__(self, size, pool_size=1):
+        self.size = size
+        width, height = size
+        self._gray = None  # sized from the first grab
+        self._small = np.empty((height, width), np.uint8)
+        self._pool = [np.empty((1, height, width, 1), np.float32) for _ in range(pool_size)]
+        self._next = 0
+
+    def __call__(self, img):
+        if self._gray is None or self._gray.shape != img.shape[:2]:
+            self._gray = np.empty(img.shape[:2], np.uint8)
+        cv2.cvtColor(img, cv2.COLOR_BGRA2GRAY, dst=self._gray)
+        cv2.resize(self._gray, self.size, dst=self._small)
+
+        out = self._pool[self._next]
+        self._next = (self._next + 1) % len(self._pool)
+        cv2.LUT(self._small, NORMALIZE_LUT, dst=out.reshape(self._small.shape))
+        return out
+
+
+class FramePipeline:
+    """
+    Capture -> preprocess -> agent, one thread per stage.
+
+    The stages are linked by small blocking queues, so a grab and its
+    preprocessing overlap the model call on the previous frame, and capture
+    simply stalls when the models fall behind instead of piling up frames.
+    Iterating yields (img, frame) pairs: the BGRA grab for display and
+    the preprocessed model input.
+    """
+
+    def __init__(self, region, size, queue_size=2):
+        self.region = region
+        self.size = size
+        self._cap_q = queue.Queue(maxsize=queue_size)
+        self._frame_q = queue.Queue(maxsize=queue_size)
+        # Frames in the queue, the one the agent holds and the one being written
+        self._preprocess = Preprocessor(size, pool_size=queue_size + 2)
+        self._stop = threading.Event()
+        self._error = None
+        self._threads = [
+            threading.Thread(target=self._capture_loop, daemon=True),
+            threading.Thread(target=self._preprocess_loop, daemon=True),
+        ]
+
+    def __enter__(self):
+        for t in self._threads:
+            t.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def __iter__(self):
+        while not self._stop.is_set():
+            try:
+                yield self._frame_q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        if self._error is not None:
+            raise self._error
+
+    def stop(self):
+        self._stop.set()
+        for t in self._threads:
+            t.join(timeout=1.0)
+
+    def _put(self, q, item):
+        # Blocking put that still notices stop()
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _capture_loop(self):
+        try:
+            # mss handles are per-thread, so it's opened here rather than by the caller
+            with mss.mss() as sct:
+                while not self._stop.is_set():
+                    shot = sct.grab(self.region)
+                    self._put(self._cap_q, shot)
+        except Exception as e:
+            self._error = e
+            self._stop.set()
+
+    def _preprocess_loop(self):
+        try:
+            while not self._stop.is_set():
+                try:
+                    shot = self._cap_q.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                # View the grabbed BGRA bytes in place instead of copying them with np.array
+                img = np.frombuffer(shot.raw, dtype=np.uint8).reshape(shot.height, shot.width, 4)
+                self._put(self._frame_q, (img, self._preprocess(img)))
+        except Exception as e:
+            self._error = e
+            self._stop.set()
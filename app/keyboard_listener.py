@@ -1,28 +1,42 @@
-# FILE: app/keyboard_listener.py (CORRECTED with pause/resume)
+# FILE: app/keyboard_listener.py
+import sys
 from pynput import keyboard
 from pynput.keyboard import Key
 
+# One bit per tracked key (gameplay keys, then hotkeys); held keys live in an int mask
+_TRACKED_KEYS = (Key.space, Key.up, Key.down, Key.left, Key.right, 'd', 'f', '1', '8', '9')
+KEY_BITS = {key: 1 << i for i, key in enumerate(_TRACKED_KEYS)}
+
 class KeyboardListener:
     """Handles global keyboard event listening for gameplay and session markers."""
     
-    GAMEPLAY_KEYS = {'d', 'f', Key.space, Key.up, Key.down, Key.left, Key.right}
+    _GAMEPLAY_SPECIAL = frozenset({Key.space, Key.up, Key.down, Key.left, Key.right})
+    _GAMEPLAY_CHARS = frozenset({'d', 'f'})
+    GAMEPLAY_KEYS = _GAMEPLAY_SPECIAL | _GAMEPLAY_CHARS
+    _GAMEPLAY_MASK = sum(map(KEY_BITS.__getitem__, GAMEPLAY_KEYS))
+
+    # Per-keystroke state is read on every event; slots skip the instance __dict__
+    __slots__ = (
+        'key_callback', 'marker_callback', 'session_toggle_callback', '_hotkeys',
+        'listener', '_pressed_mask', '_norm_cache', '_bit_cache',
+    )
 
     def __init__(self, key_callback, marker_callback, session_toggle_callback):
         self.key_callback = key_callback
         self.marker_callback = marker_callback
         self.session_toggle_callback = session_toggle_callback
         
+        # Hotkey bit -> handler, checked with a single dict lookup per press
+        self._hotkeys = {
+            KEY_BITS['1']: lambda: self.session_toggle_callback(),
+            KEY_BITS['8']: lambda: self.marker_callback("fight_start"),
+            KEY_BITS['9']: lambda: self.marker_callback("fight_end"),
+        }
+        
         self.listener = None
-        self._pressed_keys = set()
-        self.is_paused = False # NEW: Add a pause flag
-
-    # NEW: Method to pause the listener
-    def pause(self):
-        self.is_paused = True
-
-    # NEW: Method to resume the listener
-    def resume(self):
-        self.is_paused = False
+        self._pressed_mask = 0  # OR of KEY_BITS for the keys currently held
+        self._norm_cache = {}  # pynput key -> normalized name
+        self._bit_cache = {}  # pynput key -> KEY_BITS entry, 0 if untracked
 
     def start(self):
         if not self.listener:
@@ -34,42 +48,36 @@ class KeyboardListener:
             self.listener.stop()
             self.listener = None
 
-    @staticmethod
-    def _normalize_key(key):
-        if hasattr(key, 'char') and key.char:
-            return key.char.lower()
-        return str(key)
+    def _normalize_key(self, key):
+        name = self._norm_cache.get(key)
+        if name is None:
+            char = getattr(key, 'char', None)
+            # Interned so downstream dict lookups on the name hit the identity fast path
+            name = self._norm_cache[key] = sys.intern(char.lower() if char else str(key))
+        return name
 
-    def _on_press(self, key):
-        # MODIFIED: Check if paused at the very beginning
-        if self.is_paused:
-            return
+    def _key_bit(self, key):
+        bit = self._bit_cache.get(key)
+        if bit is None:
+            key_char = getattr(key, 'char', None)
+            bit = self._bit_cache[key] = KEY_BITS.get(key_char if key_char else key, 0)
+        return bit
 
-        if key in self._pressed_keys:
+    def _on_press(self, key):
+        bit = self._key_bit(key)
+        if not bit or self._pressed_mask & bit:
             return
-        self._pressed_keys.add(key)
+        self._pressed_mask |= bit
         
-        key_char = getattr(key, 'char', None)
-
-        if key_char == '1':
-            self.session_toggle_callback()
-            return 
-        if key_char == '8':
-            self.marker_callback("fight_start")
-            return
-        if key_char == '9':
-            self.marker_callback("fight_end")
+        hotkey = self._hotkeys.get(bit)
+        if hotkey:
+            hotkey()
             return
 
-        if key in self.GAMEPLAY_KEYS or (key_char and key_char in self.GAMEPLAY_KEYS):
-            self.key_callback('keydown', self._normalize_key(key))
+        self.key_callback('keydown', self._normalize_key(key))
 
     def _on_release(self, key):
-        # MODIFIED: Also check if paused on release
-        if self.is_paused:
-            return
-
-        self._pressed_keys.discard(key)
-        key_char = getattr(key, 'char', None)
-        if key in self.GAMEPLAY_KEYS or (key_char and key_char in self.GAMEPLAY_KEYS):
+        bit = self._key_bit(key)
+        self._pressed_mask &= ~bit
+        if bit & self._GAMEPLAY_MASK:
             self.key_callback('keyup', self._normalize_key(key))
\ No newline at end of file
@@ -1,17 +1,21 @@
-# FILE: app/main.py (CORRECTED to pause the listener)
+# FILE: app/main.py
 import tkinter as tk
-from tkinter import ttk, simpledialog
-import threading
-import time
+from tkinter import ttk
 from pathlib import Path
 from datetime import datetime
-import queue
+from collections import deque
 
 from session_recorder import SessionRecorder
 from keyboard_listener import KeyboardListener
 
 class SessionRecorderUI:
     """Main UㄱI for the Cuphead Session Recorder."""
+
+    # Start/Stop button config for each value of is_recording
+    _BUTTON_STATES = {
+        False: {'text': "Start Session (1)", 'style': 'Green.TButton'},
+        True: {'text': "Stop Session (1)", 'style': 'Red.TButton'},
+    }
     
     def __init__(self):
         self.root = tk.Tk()
@@ -22,40 +26,47 @@ class SessionRecorderUI:
 
         self.is_recording = False
         self.session_recorder = None
+        self._log_key_event = None  # Bound recorder method while recording, else None
         self.keyboard_listener = None
-        self.update_thread_running = True
+        self._telemetry_after_id = None
+        # Last status text shown, so an unchanged label is not re-set every tick
+        self._last_status = None
+        self._last_version = None
+        self._name_dialog = None
+        self._name_entry = None
     
-        self.ui_action_queue = queue.Queue()
+        # Markers from the listener thread wait here until Tk handles <<Marker>>.
+        # deque append/popleft are atomic under the GIL, so no lock is needed.
+        self._pending_markers = deque(maxlen=64)
         self.CAPTURE_REGION = {'top': 264, 'left': 0, 'width': 720, 'height': 403}
+        self._output_path = Path(__file__).resolve().parent.parent / "data" / "sessions"
+        self._output_path.mkdir(parents=True, exist_ok=True)
         self._create_widgets()
         self._setup_keyboard_listener()
-        self._start_ui_updates()
-        self._process_ui_queue()
+        self._telemetry_after_id = self.root.after(500, self._tick)
 
     def _create_widgets(self):
         main_frame = ttk.Frame(self.root, padding="15")
         main_frame.pack(expand=True, fill=tk.BOTH)
 
-        style = ttk.Style()
-        style.theme_use('clam')
-        style.configure('Green.TButton', background='#4CAF50', font=('Arial', 12, 'bold'))
-        style.configure('Red.TButton', background='#f44336', font=('Arial', 12, 'bold'))
+        # Styles live in the Tk interpreter; configure them only the first time in this one
+        style = ttk.Style(self.root)
+        if not style.lookup('Green.TButton', 'background'):
+            style.theme_use('clam')
+            style.configure('Green.TButton', background='#4CAF50', font=('Arial', 12, 'bold'))
+            style.configure('Red.TButton', background='#f44336', font=('Arial', 12, 'bold'))
 
-        self.start_stop_btn = ttk.Button(main_frame, text="Start Session (1)", 
-                                         command=self.toggle_session, style='Green.TButton')
+        self.start_stop_btn = ttk.Button(main_frame, command=self.toggle_session,
+                                         **self._BUTTON_STATES[False])
         self.start_stop_btn.pack(pady=10, ipady=10, fill=tk.X)
 
         status_frame = ttk.LabelFrame(main_frame, text="Live Status", padding="10")
         status_frame.pack(pady=10, expand=True, fill=tk.BOTH)
 
-        self.session_time_var = tk.StringVar(value="Session Time: 00:00")
-        ttk.Label(status_frame, textvariable=self.session_time_var, font=('Arial', 14)).pack(pady=5)
-
-        self.fights_marked_var = tk.StringVar(value="Fights Marked: 0")
-        ttk.Label(status_frame, textvariable=self.fights_marked_var).pack(pady=5)
-
-        self.last_action_var = tk.StringVar(value="Last Action: Idle")
-        ttk.Label(status_frame, textvariable=self.last_action_var).pack(pady=5)
+        # One label for all three status lines, set directly (no StringVar trace)
+        self.status_label = ttk.Label(status_frame, text="Session Time: 00:00\nFights Marked: 0\nLast Action: Idle",
+                                      justify='left', font=('Arial', 12))
+        self.status_label.pack(pady=5, anchor=tk.W)
 
         hotkey_frame = ttk.LabelFrame(main_frame, text="Hotkeys", padding="10")
         hotkey_frame.pack(pady=10, fill=tk.X)
@@ -66,81 +77,149 @@ class SessionRecorderUI:
     def _setup_keyboard_listener(self):
         self.keyboard_listener = KeyboardListener(
             key_callback=self._on_key_event,
-            marker_callback=lambda marker: self.ui_action_queue.put(('marker', marker)),
-            session_toggle_callback=lambda: self.ui_action_queue.put(('toggle_session', None))
+            marker_callback=self._post_marker,
+            session_toggle_callback=lambda: self._signal('<<SessionToggle>>')
         )
-        self.keyboard_listener.start()
-        
-    def _process_ui_queue(self):
+        self.root.bind('<<SessionToggle>>', lambda event: self.toggle_session())
+        self.root.bind('<<Marker>>', self._on_marker_signal)
+        # Start listening once mainloop is running so event_generate has a target
+        self.root.after_idle(self.keyboard_listener.start)
+
+    def _signal(self, sequence):
+        """Wakes the Tk thread from the listener thread via a virtual event."""
         try:
-            message_type, data = self.ui_action_queue.get_nowait()
-            if message_type == 'toggle_session':
-                self.toggle_session()
-            elif message_type == 'marker':
-                self._on_marker_event(data)
-        except queue.Empty:
-            pass
-        finally:
-            self.root.after(100, self._process_ui_queue)
+            self.root.event_generate(sequence, when='tail')
+        except (tk.TclError, RuntimeError):
+            pass  # window is closing
+
+    def _post_marker(self, marker):
+        self._pending_markers.append(marker)
+        self._signal('<<Marker>>')
+
+    def _on_marker_signal(self, event):
+        # Drain a bounded batch; each queued marker also raised its own signal,
+        # so anything left over is picked up by a later <<Marker>>
+        for _ in range(32):
+            try:
+                marker = self._pending_markers.popleft()
+            except IndexError:
+                break
+            self._on_marker_event(marker)
 
     def toggle_session(self):
         if self.is_recording:
+            self._log_key_event = None
             if self.session_recorder:
                 self.session_recorder.stop_session()
+                stats = self.session_recorder.get_session_stats()
+                self._show_stats(stats['elapsed_s'], stats['fights_marked'], stats['last_action'])
             self.is_recording = False
-            self.start_stop_btn.config(text="Start Session (1)", style='Green.TButton')
+            self._update_ui_state()
         else:
-            # MODIFIED: Pause listener before showing dialog
-            self.keyboard_listener.pause()
-            session_name = simpledialog.askstring("Session Name", "Enter a name for this session:",
-                                                  initialvalue=f"session_{datetime.now():%Y-%m-%d_%H-%M}")
-            # MODIFIED: Resume listener after dialog is closed
-            self.keyboard_listener.resume()
-
-            if not session_name:
-                return
-
-            output_path = Path(__file__).parent.parent / "data" / "sessions"
-            self.session_recorder = SessionRecorder(output_dir=output_path, region=self.CAPTURE_REGION)
-            self.session_recorder.start_session(session_name)
-            self.is_recording = True
-            self.start_stop_btn.config(text="Stop Session (1)", style='Red.TButton')
+            self._open_name_dialog()
+
+    def _open_name_dialog(self):
+        """Asks for the session name without a nested event loop, so telemetry keeps running."""
+        if self._name_dialog is not None:
+            self._name_dialog.lift()
+            return
+        # The listener keeps running: while the dialog is open '1' only raises it
+        # (see above), and markers and key logging are ignored until recording starts
+
+        top = tk.Toplevel(self.root)
+        top.title("Session Name")
+        top.transient(self.root)
+        top.attributes('-topmost', True)
+        top.protocol("WM_DELETE_WINDOW", self._close_name_dialog)
+        ttk.Label(top, text="Enter a name for this session:").pack(padx=10, pady=(10, 5))
+
+        entry = ttk.Entry(top, width=32)
+        entry.insert(0, f"session_{datetime.now():%Y-%m-%d_%H-%M}")
+        entry.select_range(0, tk.END)
+        entry.pack(padx=10, fill=tk.X)
+        entry.focus_set()
+        entry.bind('<Return>', lambda event: self._confirm_name_dialog())
+        top.bind('<Escape>', lambda event: self._close_name_dialog())
+
+        buttons = ttk.Frame(top)
+        buttons.pack(pady=10)
+        ttk.Button(buttons, text="OK", command=self._confirm_name_dialog).pack(side=tk.LEFT, padx=5)
+        ttk.Button(buttons, text="Cancel", command=self._close_name_dialog).pack(side=tk.LEFT, padx=5)
+
+        self._name_dialog = top
+        self._name_entry = entry
+
+    def _confirm_name_dialog(self):
+        session_name = self._name_entry.get().strip() if self._name_entry else ""
+        self._close_name_dialog()
+        if session_name:
+            self.root.after_idle(self._begin_recording, session_name)
+
+    def _close_name_dialog(self):
+        if self._name_dialog is not None:
+            self._name_dialog.destroy()
+        self._name_dialog = None
+        self._name_entry = None
+
+    def _begin_recording(self, session_name):
+        if self.is_recording:
+            return
+        # One recorder for the app's lifetime, so its capture handle and buffers are reused
+        if self.session_recorder is None:
+            self.session_recorder = SessionRecorder(output_dir=self._output_path, region=self.CAPTURE_REGION)
+        self.session_recorder.start_session(session_name)
+        self._last_version = None
+        self.is_recording = True
+        self._log_key_event = self.session_recorder.log_key_event
+        self._update_ui_state()
+
+    def _update_ui_state(self):
+        self.start_stop_btn.config(**self._BUTTON_STATES[self.is_recording])
     
     def _on_key_event(self, event_type, key):
-        if self.is_recording and self.session_recorder:
-            self.session_recorder.log_key_event(event_type, key)
+        # Runs on the listener thread for every key; read the bound method once
+        log_key_event = self._log_key_event
+        if log_key_event is not None:
+            log_key_event(event_type, key)
 
     def _on_marker_event(self, marker_type):
         if self.is_recording and self.session_recorder:
             self.session_recorder.log_marker_event(marker_type)
 
     def _update_telemetry(self):
-        if self.session_recorder:
-            stats = self.session_recorder.get_session_stats()
-            elapsed_s = int(stats['elapsed_s'])
-            minutes, seconds = divmod(elapsed_s, 60)
-            self.session_time_var.set(f"Session Time: {minutes:02d}:{seconds:02d}")
-            self.fights_marked_var.set(f"Fights Marked: {stats['fights_marked']}")
-            self.last_action_var.set(f"Last Action: {stats['last_action']}")
-
-    def _start_ui_updates(self):
-        def update_loop():
-            while self.update_thread_running:
-                try:
-                    self.root.after(0, self._update_telemetry)
-                    time.sleep(0.5)
-                except (tk.TclError, RuntimeError):
-                    break
-        threading.Thread(target=update_loop, daemon=True).start()
+        if not self.is_recording or not self.session_recorder:
+            return
+        recorder = self.session_recorder
+        version = recorder.get_state_version()
+        if version == self._last_version and not recorder.in_fight:
+            return  # nothing changed and the fight timer is not running
+        self._last_version = version
+        # Plain attribute reads; no stats dict is built on the tick path
+        self._show_stats(recorder.get_fight_elapsed_s(), recorder.fights_marked, recorder.last_action)
+
+    def _show_stats(self, elapsed_s, fights_marked, last_action):
+        minutes, seconds = divmod(int(elapsed_s), 60)
+        status = (f"Session Time: {minutes:02d}:{seconds:02d}\n"
+                  f"Fights Marked: {fights_marked}\n"
+                  f"Last Action: {last_action}")
+        if status != self._last_status:
+            self.status_label.config(text=status)
+            self._last_status = status
+
+    def _tick(self):
+        # Re-arms itself on Tk's own scheduler; no helper thread needed
+        self._update_telemetry()
+        self._telemetry_after_id = self.root.after(500, self._tick)
 
     def run(self):
         self.root.protocol("WM_DELETE_WINDOW", self._on_closing)
         self.root.mainloop()
 
     def _on_closing(self):
-        self.update_thread_running = False
-        if self.is_recording and self.session_recorder:
-            self.session_recorder.stop_session()
+        if self._telemetry_after_id:
+            self.root.after_cancel(self._telemetry_after_id)
+        if self.session_recorder:
+            self.session_recorder.close()
         if self.keyboard_listener:
             self.keyboard_listener.stop()
         self.root.destroy()
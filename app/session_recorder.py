@@ -1,11 +1,169 @@
-import json
+import os
+import sys
 import time
+import shutil
+import subprocess
 import threading
 import cv2
 import mss
 import numpy as np
 from pathlib import Path
 
+# orjson serializes straight to bytes; the stdlib fallback matches its compact output
+try:
+    import orjson
+    _dumps = orjson.dumps
+except ImportError:
+    import json
+    def _dumps(obj) -> bytes:
+        return json.dumps(obj, separators=(',', ':')).encode()
+
+# dxcam (Windows only) captures through DXGI Desktop Duplication; mss is the fallback
+dxcam = None
+if sys.platform == 'win32':
+    try:
+        import dxcam
+    except ImportError:
+        pass
+
+# Optional: a Numba kernel for BGRA -> BGR; the NumPy strided copy is the fallback
+try:
+    from numba import njit, prange
+except ImportError:
+    njit = None
+
+if njit is not None:
+    @njit(parallel=True, cache=True)
+    def _bgra_to_bgr(src, dst):
+        for y in prange(src.shape[0]):
+            for x in range(src.shape[1]):
+                dst[y, x, 0] = src[y, x, 0]
+                dst[y, x, 1] = src[y, x, 1]
+                dst[y, x, 2] = src[y, x, 2]
+
+    # Compile at import so the first captured frame does not pay for it
+    _bgra_to_bgr(np.zeros((4, 4, 4), np.uint8), np.empty((4, 4, 3), np.uint8))
+else:
+    def _bgra_to_bgr(src, dst):
+        np.copyto(dst, src[:, :, :3])
+
+_utc_now = time.time
+
+# Capture and video rate shared by the worker, capture backend and writer
+TARGET_FPS = 10.0
+FRAME_DURATION = 1.0 / TARGET_FPS
+# Frame slots between capture and encoder (power of two, so index = count & mask)
+FRAME_RING_SIZE = 16
+
+# Pre-encoded '{"event":...,"key":...,"t":' prefixes, one per (event, key) pair
+_KEY_EVENT_PREFIXES = {}
+
+def _key_event_prefix(event_type: str, key: str) -> bytes:
+    prefix = _KEY_EVENT_PREFIXES.get((event_type, key))
+    if prefix is None:
+        prefix = b'{"event":' + _dumps(event_type) + b',"key":' + _dumps(key) + b',"t":'
+        _KEY_EVENT_PREFIXES[(event_type, key)] = prefix
+    return prefix
+
+def _boost_current_thread(core_from_end: int):
+    """
+    Best effort: pins the calling thread to one core (counted from the last) and
+    raises its priority above the UI. Silently does nothing where unsupported.
+    """
+    core = max(0, (os.cpu_count() or 1) - 1 - core_from_end)
+    if sys.platform == 'win32':
+        try:
+            import ctypes
+            kernel32 = ctypes.windll.kernel32
+            thread = kernel32.GetCurrentThread()
+            kernel32.SetThreadAffinityMask(thread, ctypes.c_size_t(1 << core))
+            kernel32.SetThreadPriority(thread, 1)  # THREAD_PRIORITY_ABOVE_NORMAL
+        except (OSError, AttributeError):
+            pass
+        return
+    # On Linux both calls apply to the calling thread only
+    try:
+        os.sched_setaffinity(0, {core})
+    except (OSError, AttributeError):
+        pass
+    try:
+        os.nice(-5)
+    except OSError:
+        pass  # raising priority needs CAP_SYS_NICE
+
+# fallocate(2) mode that reserves blocks without moving end-of-file
+_FALLOC_FL_KEEP_SIZE = 0x01
+
+def _preallocate(file, size: int):
+    """
+    Best effort: reserves size bytes of disk for file up front so it does not
+    have to grow mid-session. The file's size is left alone, so a session that
+    dies mid-write still leaves valid JSONL (no NUL tail) up to the last flush.
+    """
+    import ctypes
+    try:
+        if sys.platform.startswith('linux'):
+            libc = ctypes.CDLL(None, use_errno=True)
+            libc.fallocate(file.fileno(), _FALLOC_FL_KEEP_SIZE,
+                           ctypes.c_int64(0), ctypes.c_int64(size))
+        elif sys.platform == 'win32':
+            import msvcrt
+
+            class _FILE_ALLOCATION_INFO(ctypes.Structure):
+                _fields_ = [('AllocationSize', ctypes.c_int64)]
+
+            info = _FILE_ALLOCATION_INFO(size)
+            # FileAllocationInfo (5) reserves clusters; unlike SetEndOfFile it keeps EOF where it is
+            ctypes.windll.kernel32.SetFileInformationByHandle(
+                ctypes.c_void_p(msvcrt.get_osfhandle(file.fileno())), 5,
+                ctypes.byref(info), ctypes.sizeof(info))
+    except (OSError, AttributeError):
+        pass
+
+class _FFmpegWriter:
+    """
+    Pipes raw BGR frames to a multithreaded libx264 ffmpeg process (cv2.VideoWriter interface).
+    If ffmpeg stops accepting frames, says so once and records the rest with mp4v.
+    """
+
+    def __init__(self, ffmpeg: str, video_path: Path, fps: float, size: tuple):
+        w, h = size
+        self._video_path, self._fps, self._size = video_path, fps, size
+        self._fallback = None
+        self._proc = subprocess.Popen(
+            [ffmpeg, '-hide_banner', '-loglevel', 'error', '-y',
+             '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-s', f'{w}x{h}', '-r', str(fps), '-i', '-',
+             # yuv420p needs even dimensions; pad odd regions (e.g. 720x403) by one black row/column
+             '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2',
+             '-c:v', 'libx264', '-preset', 'ultrafast', '-tune', 'zerolatency', '-threads', '0',
+             '-pix_fmt', 'yuv420p', str(video_path)],
+            stdin=subprocess.PIPE, bufsize=10 * w * h * 3
+        )
+        self._stdin = self._proc.stdin
+
+    def write(self, frame: np.ndarray):
+        if self._fallback is not None:
+            self._fallback.write(frame)
+            return
+        try:
+            self._stdin.write(frame.data)  # contiguous frame, written without a bytes copy
+        except (BrokenPipeError, ValueError):
+            print(f"ffmpeg stopped accepting frames (exit code {self._proc.poll()}), "
+                  f"recording the rest of the session with mp4v")
+            self._fallback = cv2.VideoWriter(str(self._video_path), cv2.VideoWriter_fourcc(*'mp4v'),
+                                             self._fps, self._size)
+            self._fallback.write(frame)
+
+    def release(self):
+        try:
+            self._stdin.close()
+        except BrokenPipeError:
+            pass
+        if self._proc.wait() and self._fallback is None:
+            print(f"ffmpeg exited with code {self._proc.returncode}")
+        if self._fallback is not None:
+            self._fallback.release()
+
 class SessionRecorder:
     """
     Handles synchronized screen recording and keystroke logging using Absolute UTC Time.
@@ -17,6 +175,11 @@ class SessionRecorder:
         self.region = region
         self.output_dir.mkdir(parents=True, exist_ok=True)
         
+        # Reused frame buffer: each grab is converted into it in place
+        self._bgr_buf = np.empty((region['height'], region['width'], 3), np.uint8)
+        # One mss handle for every session, opened on first use and released by close()
+        self._sct = None
+        
         self.is_recording = False
         
         # File Handles
@@ -24,21 +187,49 @@ class SessionRecorder:
         self._event_file = None  # Stores Key presses
         self._frame_file = None  # Stores Frame timestamps
         
+        # Log lines are batched in memory as encoded bytes; the flusher thread
+        # writes them every 50 ms, or sooner once a buffer reaches the limit
+        self._event_buf = []
+        self._append_event = self._event_buf.append
+        self._frame_buf = []
+        self._log_buf_limit = 64
+        self._flush_interval = 0.05
+        self._flush_wake = threading.Event()
+        self._flusher_thread = None
+        
         self._recording_thread = None
         self._shutdown_event = threading.Event()
         
-        # UI Stats
+        # Single-producer/single-consumer ring of preallocated frames for the encoder.
+        # _ring_head (capture) and _ring_tail (encoder) only grow, and each has one
+        # writer, so plain ints are enough; the event is only a wakeup. A full ring drops.
+        frame_shape = (region['height'], region['width'], 3)
+        self._ring = [np.empty(frame_shape, np.uint8) for _ in range(FRAME_RING_SIZE)]
+        self._ring_meta = [None] * FRAME_RING_SIZE  # (n, lines) per slot
+        self._ring_head = 0
+        self._ring_tail = 0
+        self._ring_ready = threading.Event()
+        self._capture_done = False
+        self._encoder_thread = None
+        self.frames_dropped = 0
+        
+        # UI Stats. The UI thread reads these without a lock: each is a single
+        # int/str rebinding, so a reader sees the old or the new value, never a torn one
         self.fights_marked = 0
         self.last_action = ""
+        self._state_version = 0  # Bumped whenever the stats above change
         
-        # Fight Timer Logic (For UI Display Only)
+        # Fight Timer Logic (For UI Display Only, integer perf_counter_ns)
         self.in_fight = False
-        self.total_fight_time = 0.0  # Accumulated time of completed fights
-        self.current_fight_start_time = 0.0 # Start time of current active fight
+        self.total_fight_ns = 0  # Accumulated time of completed fights
+        self.current_fight_start_ns = 0 # Start time of current active fight
 
     def start_session(self, session_name: str):
         if self.is_recording:
             return
+        # The previous session's worker may still be closing its files
+        if self._recording_thread is not None:
+            self._recording_thread.join()
 
         print(f"Starting session: {session_name}")
         self.is_recording = True
@@ -47,9 +238,10 @@ class SessionRecorder:
         # Reset Stats
         self.fights_marked = 0
         self.last_action = "Ready"
+        self._state_version += 1
         self.in_fight = False
-        self.total_fight_time = 0.0
-        self.current_fight_start_time = 0.0
+        self.total_fight_ns = 0
+        self.current_fight_start_ns = 0
         
         # --- Define Paths ---
         video_path = self.output_dir / f"{session_name}.mp4"
@@ -57,47 +249,91 @@ class SessionRecorder:
         frame_path = self.output_dir / f"{session_name}_frames.jsonl"
         
         # --- Init Video Writer (10 FPS) ---
-        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-        self._video_writer = cv2.VideoWriter(
-            str(video_path), 
-            fourcc, 
-            10.0, 
-            (self.region['width'], self.region['height'])
-        )
+        self._video_writer = self._open_video_writer(video_path, TARGET_FPS)
         
         # --- Init Logs ---
-        self._event_file = open(event_path, 'w')
-        self._frame_file = open(frame_path, 'w')
+        self._event_buf = []
+        self._append_event = self._event_buf.append
+        self._frame_buf = []
+        # 1 MiB buffers: batched lines reach the OS in large writes, flushed on close
+        self._event_file = open(event_path, 'wb', buffering=1 << 20)
+        self._frame_file = open(frame_path, 'wb', buffering=1 << 20)
+        # ~16 MiB covers hours of key events; 4 MiB is over an hour of frame lines at 10 FPS
+        _preallocate(self._event_file, 16 << 20)
+        _preallocate(self._frame_file, 4 << 20)
+        self._flush_wake.clear()
+        self._flusher_thread = threading.Thread(target=self._log_flusher, daemon=True)
+        self._flusher_thread.start()
         
-        # Start Worker
+        # Start Encoder, then the capture Worker that feeds it
+        self._ring_head = self._ring_tail = 0
+        self._capture_done = False
+        self._ring_ready.clear()
+        self.frames_dropped = 0
+        self._encoder_thread = threading.Thread(target=self._encoder_loop, daemon=True)
+        self._encoder_thread.start()
         self._recording_thread = threading.Thread(target=self._worker, daemon=True)
         self._recording_thread.start()
 
+    def _open_video_writer(self, video_path: Path, fps: float):
+        """
+        Opens an H.264 writer on the FFmpeg backend with hardware encoding
+        (NVENC/QSV/VideoToolbox, whichever the build offers). Without one, pipes
+        to an ffmpeg libx264 process if ffmpeg is on PATH, else software mp4v.
+        """
+        size = (self.region['width'], self.region['height'])
+        try:
+            writer = cv2.VideoWriter(
+                str(video_path), cv2.CAP_FFMPEG, cv2.VideoWriter_fourcc(*'avc1'), fps, size,
+                [cv2.VIDEOWRITER_PROP_HW_ACCELERATION, cv2.VIDEO_ACCELERATION_ANY]
+            )
+            if writer.isOpened():
+                return writer
+        except (cv2.error, AttributeError):
+            pass  # OpenCV < 4.5.2 has no acceleration params
+        ffmpeg = shutil.which('ffmpeg')
+        if ffmpeg:
+            print("Hardware H.264 encoder unavailable, using ffmpeg libx264")
+            return _FFmpegWriter(ffmpeg, video_path, fps, size)
+        print("Hardware H.264 encoder unavailable, using mp4v")
+        return cv2.VideoWriter(str(video_path), cv2.VideoWriter_fourcc(*'mp4v'), fps, size)
+
     def stop_session(self):
         if not self.is_recording:
             return
         
         # If we stop session while in a fight, add the partial time
         if self.in_fight:
-            self.total_fight_time += (time.time() - self.current_fight_start_time)
+            self.total_fight_ns += time.perf_counter_ns() - self.current_fight_start_ns
             self.in_fight = False
             
         print("Stopping session...")
         self.is_recording = False
+        self._state_version += 1
         self._shutdown_event.set()
 
+    def close(self):
+        """Stops any running session and releases the capture handle."""
+        self.stop_session()
+        if self._recording_thread is not None:
+            self._recording_thread.join()
+            self._recording_thread = None
+        if self._sct is not None:
+            self._sct.close()
+            self._sct = None
+
     def log_key_event(self, event_type: str, key: str):
         """Logs a key press with exact UTC time."""
         if not self.is_recording: return
         
-        # UTC TIMESTAMP
-        t = time.time()
-        
-        entry = {'event': event_type, 'key': key, 't': t}
-        self._event_file.write(json.dumps(entry) + '\n')
-        self._event_file.flush() # Ensure it's written immediately
+        # UTC TIMESTAMP (append is bound once per session)
+        t = _utc_now()
+        self._append_event(_key_event_prefix(event_type, key) + repr(t).encode() + b'}\n')
+        if len(self._event_buf) >= self._log_buf_limit:
+            self._flush_wake.set()
         
         self.last_action = f"{key} ({event_type})"
+        self._state_version += 1
 
     def log_marker_event(self, marker_type: str):
         """Logs a fight marker with exact UTC time and updates Fight Timer."""
@@ -106,91 +342,242 @@ class SessionRecorder:
         # UTC TIMESTAMP
         t = time.time()
         
-        entry = {'event': 'marker', 'type': marker_type, 't': t}
-        self._event_file.write(json.dumps(entry) + '\n')
-        self._event_file.flush()
+        # Markers share the key event buffer drained by the log flusher.
+        # Marker types are fixed identifiers, so a template needs no escaping
+        self._append_event(f'{{"event":"marker","type":"{marker_type}","t":{t!r}}}\n'.encode())
+        if len(self._event_buf) >= self._log_buf_limit:
+            self._flush_wake.set()
         
         print(f"📍 MARKER: {marker_type}")
         self.last_action = f"MARKER: {marker_type}"
+        self._state_version += 1
         
         # --- Timer Logic for UI ---
         if marker_type == 'fight_start':
             self.fights_marked += 1
             if not self.in_fight:
                 self.in_fight = True
-                self.current_fight_start_time = t
+                self.current_fight_start_ns = time.perf_counter_ns()
                 
         elif marker_type == 'fight_end':
             if self.in_fight:
                 # Add the duration of this specific fight to the total
-                duration = t - self.current_fight_start_time
-                self.total_fight_time += duration
+                duration_ns = time.perf_counter_ns() - self.current_fight_start_ns
+                self.total_fight_ns += duration_ns
                 self.in_fight = False
 
+    @staticmethod
+    def _drain(buf: list, file):
+        """Writes the lines currently in buf to file in one call."""
+        # Take a fixed count and delete only that slice: lines appended by other
+        # threads meanwhile stay for the next drain, and the list is never
+        # replaced, so bound append methods stay valid
+        n = len(buf)
+        if n:
+            file.write(b''.join(buf[:n]))
+            del buf[:n]
+
+    def _flush_logs(self):
+        self._drain(self._event_buf, self._event_file)
+        self._drain(self._frame_buf, self._frame_file)
+
+    def _log_flusher(self):
+        """Writes batched log lines until the session shuts down."""
+        wait, clear = self._flush_wake.wait, self._flush_wake.clear
+        while not self._shutdown_event.is_set():
+            wait(self._flush_interval)
+            clear()
+            self._flush_logs()
+
+    def get_state_version(self) -> int:
+        """Returns a counter bumped on every stats change (the running fight timer aside)."""
+        return self._state_version
+
     def get_session_stats(self) -> dict:
         """Returns stats for the UI. elapsed_s now returns Total Fight Time."""
         if not self.is_recording:
             return {'elapsed_s': 0, 'fights_marked': 0, 'last_action': 'Stopped'}
         
-        # Calculate time to display
-        current_display_time = self.total_fight_time
-        if self.in_fight:
-            current_display_time += (time.time() - self.current_fight_start_time)
-            
         return {
-            'elapsed_s': current_display_time, 
+            'elapsed_s': self.get_fight_elapsed_s(), 
             'fights_marked': self.fights_marked, 
             'last_action': self.last_action
         }
 
+    def get_fight_elapsed_s(self) -> int:
+        """Returns whole seconds of fight time, including the fight in progress."""
+        fight_ns = self.total_fight_ns
+        if self.in_fight:
+            fight_ns += time.perf_counter_ns() - self.current_fight_start_ns
+        return fight_ns // 1_000_000_000
+
+    def _open_capture(self):
+        """
+        Returns (grab, close). grab() fills self._bgr_buf with the current frame;
+        close is None when the handle is kept for later sessions.
+        Uses DXGI Desktop Duplication (dxcam) on Windows when available, else mss.
+        """
+        region = self.region
+        h, w = region['height'], region['width']
+        frame_bgr = self._bgr_buf
+
+        if dxcam is not None:
+            try:
+                cam = dxcam.create(output_idx=0, output_color="BGR")
+                # video_mode repeats the last frame, so a static screen never blocks the grab
+                cam.start(region=(region['left'], region['top'], region['left'] + w, region['top'] + h),
+                          target_fps=int(TARGET_FPS), video_mode=True)
+            except Exception as e:
+                print(f"dxcam unavailable, falling back to mss: {e}")
+            else:
+                def grab_dxcam():
+                    np.copyto(frame_bgr, cam.get_latest_frame())
+                return grab_dxcam, cam.stop
+
+        if self._sct is None:
+            self._sct = mss.mss()
+        sct = self._sct
+        scaled_bgr = None  # full-size BGR frame, only needed on HiDPI screens
+        def grab_mss():
+            nonlocal scaled_bgr
+            img = sct.grab(region)
+            # View mss's BGRA bytes without copying, then drop alpha into the BGR buffer
+            bgra = np.frombuffer(img.raw, dtype=np.uint8).reshape(img.height, img.width, 4)
+            if (img.height, img.width) == (h, w):
+                _bgra_to_bgr(bgra, frame_bgr)
+                return
+            # Retina / HiDPI: mss returns the region in physical pixels (e.g. 2x), scale it down
+            if scaled_bgr is None or scaled_bgr.shape[:2] != bgra.shape[:2]:
+                scaled_bgr = np.empty((img.height, img.width, 3), np.uint8)
+            _bgra_to_bgr(bgra, scaled_bgr)
+            cv2.resize(scaled_bgr, (w, h), dst=frame_bgr, interpolation=cv2.INTER_AREA)
+        # The handle outlives the session; close() releases it
+        return grab_mss, None
+
+    def _encoder_loop(self):
+        """Writes ring frames to the video and their UTC times to the frame log.
+        Each slot carries (n, lines): its frame fills n consecutive video slots."""
+        _boost_current_thread(core_from_end=1)
+        ring, meta, mask = self._ring, self._ring_meta, FRAME_RING_SIZE - 1
+        ready = self._ring_ready
+        vw_write = self._video_writer.write
+        append_frame_line = self._frame_buf.append
+        frame_buf, limit, wake = self._frame_buf, self._log_buf_limit, self._flush_wake
+        tail = 0
+        while True:
+            # Read done before head: once done is seen, head is final
+            done = self._capture_done
+            if tail == self._ring_head:
+                if done:
+                    break
+                # Clear, then re-check, so a frame published in between is not missed
+                ready.clear()
+                if tail == self._ring_head and not self._capture_done:
+                    ready.wait()
+                continue
+            idx = tail & mask
+            n, lines = meta[idx]
+            frame = ring[idx]
+            for _ in range(n):
+                vw_write(frame)
+            # Only now may capture reuse the slot
+            tail += 1
+            self._ring_tail = tail
+            
+            # RECORD EXACT MAPPING: Frame -> UTC Time (all n lines in one chunk)
+            append_frame_line(lines)
+            if len(frame_buf) >= limit:
+                wake.set()
+
     def _worker(self):
         """
-        Uses UTC scheduling to ensure frames line up with wall-clock time.
+        Schedules frames on the monotonic clock and stamps them in UTC via a fixed
+        wall-clock anchor, so frame times line up with the key event log without
+        a wall-clock step (NTP, manual change) bursting or stalling the schedule.
         """
+        close_capture = None
+        _boost_current_thread(core_from_end=0)
         try:
-            with mss.mss() as sct:
-                target_fps = 10.0
-                frame_duration = 1.0 / target_fps
+            frame_duration = FRAME_DURATION
+            grab, close_capture = self._open_capture()
+            frame_bgr = self._bgr_buf
+            # Loop-invariant lookups bound once
+            ring, meta, mask = self._ring, self._ring_meta, FRAME_RING_SIZE - 1
+            ring_ready = self._ring_ready.set
+            head = 0
+            t_now = time.monotonic
+            shutdown_set, shutdown_wait = self._shutdown_event.is_set, self._shutdown_event.wait
+            
+            # Schedule on the monotonic clock; frames are logged as monotonic + anchor (UTC).
+            # Slot i is due at start + i * frame_duration, so no error accumulates
+            start = t_now()
+            start_utc = start + (_utc_now() - t_now())
+            frame_idx = 0
+            next_frame_time = start
+
+            while not shutdown_set():
+                # 1. Capture Frame
+                try:
+                    grab()
+                except Exception as e:
+                    print(f"Capture error: {e}")
+                    # Wait for the next slot (at least one frame) rather than spinning on the error
+                    shutdown_wait(max(next_frame_time - t_now(), frame_duration))
+                    continue
+
+                # 2. Sync Logic
+                now = t_now()
                 
-                # Schedule based on absolute UTC time
-                next_frame_time = time.time()
-
-                while not self._shutdown_event.is_set():
-                    # 1. Capture Frame
-                    try:
-                        img = sct.grab(self.region)
-                        img_np = np.array(img)
-                        frame_bgr = cv2.cvtColor(img_np, cv2.COLOR_BGRA2BGR)
-                    except Exception as e:
-                        print(f"Capture error: {e}")
-                        continue
-
-                    # 2. Sync Logic
-                    now = time.time()
-                    
-                    while next_frame_time < now:
-                        # Write video frame
-                        self._video_writer.write(frame_bgr)
-                        
-                        # RECORD EXACT MAPPING: Frame -> UTC Time
-                        frame_entry = {"t": next_frame_time}
-                        self._frame_file.write(json.dumps(frame_entry) + '\n')
-                        
-                        # Advance schedule
-                        next_frame_time += frame_duration
+                if next_frame_time < now:
+                    # Every slot that has come due gets this frame (more than one after a stall)
+                    n = int((now - next_frame_time) / frame_duration) + 1
+                    lines = ''.join([f'{{"t":{start_utc + i * frame_duration!r}}}\n'
+                                     for i in range(frame_idx, frame_idx + n)]).encode()
+                    # The grab buffer is refilled next iteration; copy it into a free slot
+                    if head - self._ring_tail < FRAME_RING_SIZE:
+                        idx = head & mask
+                        np.copyto(ring[idx], frame_bgr)
+                        meta[idx] = (n, lines)
+                        # Publish only after the slot is filled
+                        head += 1
+                        self._ring_head = head
+                        ring_ready()
+                    else:
+                        self.frames_dropped += n
                     
-                    # 3. Sleep
-                    # Only sleep if we are ahead of schedule
-                    time_to_sleep = next_frame_time - time.time()
-                    if time_to_sleep > 0:
-                        time.sleep(time_to_sleep)
+                    # Advance schedule
+                    frame_idx += n
+                    next_frame_time = start + frame_idx * frame_duration
+                
+                # 3. Sleep
+                # Only sleep if we are ahead of schedule; stop_session ends the wait at once
+                time_to_sleep = next_frame_time - t_now()
+                if time_to_sleep > 0:
+                    shutdown_wait(time_to_sleep)
                     
         finally:
             print("Worker cleanup...")
+            if close_capture:
+                close_capture()
+            # Let the encoder drain the ring before the files close
+            self._capture_done = True
+            self._ring_ready.set()
+            self._encoder_thread.join()
+            if self.frames_dropped:
+                print(f"Dropped {self.frames_dropped} frames (encoder backlog)")
+            # With shutdown set (also when the worker failed) the flusher exits after one more pass
+            self._shutdown_event.set()
+            self._flush_wake.set()
+            self._flusher_thread.join()
             if self._video_writer:
                 self._video_writer.release()
             if self._event_file:
+                self._drain(self._event_buf, self._event_file)
+                self._event_file.truncate()  # flushes, then releases the unused reservation
+                os.fsync(self._event_file.fileno())
                 self._event_file.close()
             if self._frame_file:
+                self._drain(self._frame_buf, self._frame_file)
+                self._frame_file.truncate()
                 self._frame_file.close()
             print("Files closed and saved.")
\ No newline at end of file
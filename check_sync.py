@@ -1,8 +1,36 @@
+import re
+import csv
+import mmap
+import argparse
 import cv2
-import json
 import numpy as np
 from pathlib import Path
 
+# orjson parses the log lines faster; the stdlib parser is the fallback, as in the recorder
+try:
+    import orjson
+    _loads, _JSONDecodeError = orjson.loads, orjson.JSONDecodeError
+except ImportError:
+    import json
+    _loads, _JSONDecodeError = json.loads, json.JSONDecodeError
+
+KEY_EVENTS = frozenset({'keydown', 'keyup'})
+# Every _frames.jsonl line is {"t": <float>}, so the value can be pulled out without a JSON parse
+FRAME_T_RE = re.compile(rb'"t":\s*([-+0-9.eE]+)')
+
+# Overlay layout, built once instead of on every drawn frame
+KEY_POSITIONS = {
+    'Key.up': (70, 50), 'Key.left': (30, 90), 'Key.down': (70, 90), 'Key.right': (110, 90),
+    'Key.space': (30, 150), 'f': (150, 150), 'd': (200, 150)
+}
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+_DISPLAY_NAMES = {'f': "SHOOT", 'd': "DASH"}
+# (key, label, text origin) with the label and offset position worked out once
+_KEY_LABELS = [
+    (key, _DISPLAY_NAMES.get(key, key.replace("Key.", "").upper()), (x + 20, y + 30))
+    for key, (x, y) in KEY_POSITIONS.items()
+]
+
 def build_key_state_timeline(log_path: Path) -> list:
     """
     Parses the _events.jsonl file (UTC timestamps).
@@ -12,73 +40,139 @@ def build_key_state_timeline(log_path: Path) -> list:
         print(f"❌ Event log not found: {log_path}")
         return []
 
-    with open(log_path, 'r') as f:
-        for line in f:
-            try:
-                data = json.loads(line)
-                if data.get('event') in ['keydown', 'keyup']:
-                    key_events.append((data['t'], data['key'], data['event']))
-            except json.JSONDecodeError: continue
+    # One read, split in C, instead of iterating the file object line by line
+    for line in log_path.read_bytes().splitlines():
+        # Cheap substring screen: markers and anything else skip the parser
+        if b'"keydown"' not in line and b'"keyup"' not in line: continue
+        try:
+            data = _loads(line)
+            event = data.get('event')
+            if event in KEY_EVENTS:
+                key_events.append((data['t'], data['key'], event))
+        except _JSONDecodeError: continue
     
     # Sort by UTC timestamp
     key_events.sort(key=lambda x: x[0])
     return key_events
 
-def load_frame_timestamps(frame_log_path: Path) -> list:
+def load_frame_timestamps(frame_log_path: Path) -> np.ndarray:
     """
     Parses the _frames.jsonl file.
-    Returns a list where list[i] = UTC timestamp of Frame i.
+    Returns an array where array[i] = UTC timestamp of Frame i.
     """
-    timestamps = []
     if not frame_log_path.exists():
         print(f"❌ Frame log not found: {frame_log_path}")
-        return []
+        return np.empty(0)
+    if frame_log_path.stat().st_size == 0:
+        return np.empty(0)
 
-    with open(frame_log_path, 'r') as f:
-        for line in f:
-            try:
-                data = json.loads(line)
-                timestamps.append(data['t'])
-            except: continue
-    return timestamps
+    # Regex straight over the mapped file; lines that do not match are skipped
+    with open(frame_log_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        return np.array(FRAME_T_RE.findall(mm), dtype=np.float64)
 
-def get_keys_down_at_time(timeline: list, target_utc: float) -> set:
+def build_snapshot_index(timeline: list) -> tuple:
     """
-    Replays history up to target_utc.
+    Replays the timeline once.
+    Returns (times, snapshots): snapshots[i] = keys down right after event i at times[i].
     """
+    times = np.empty(len(timeline), dtype=np.float64)
+    snapshots = []
     keys_down = set()
-    for t, key, event in timeline:
-        if t > target_utc: break
+    for i, (t, key, event) in enumerate(timeline):
         if event == 'keydown': keys_down.add(key)
         elif event == 'keyup': keys_down.discard(key)
-    return keys_down
-
-def draw_key_state_on_frame(frame, keys_down: set, offset: float, utc_time: float):
-    # Visual overlay
-    key_positions = {
-        'Key.up': (70, 50), 'Key.left': (30, 90), 'Key.down': (70, 90), 'Key.right': (110, 90),
-        'Key.space': (30, 150), 'f': (150, 150), 'd': (200, 150)
-    }
-    # Draw Background
-    cv2.rectangle(frame, (10, 20), (370, 220), (0, 0, 0), -1)
-    
-    # Draw Keys
-    for key, (x, y) in key_positions.items():
-        pos = (x + 20, y + 30)
+        times[i] = t
+        snapshots.append(frozenset(keys_down))
+    return times, snapshots
+
+def get_keys_down_at_time(index: tuple, target_utc: float) -> frozenset:
+    """
+    Binary-searches the snapshot index for the key state at target_utc.
+    """
+    times, snapshots = index
+    i = int(np.searchsorted(times, target_utc, side='right')) - 1
+    return snapshots[i] if i >= 0 else frozenset()
+
+# Rendered overlay tiles, one per distinct set of keys down (at most 2^7)
+_OVERLAY_TILES = {}
+
+def _render_overlay_tile(keys_down: frozenset) -> np.ndarray:
+    """Draws the static part of the overlay: background, key labels and help text."""
+    # Black canvas up to the overlay's far corner; the tile is its (10, 20)-(370, 220) box
+    canvas = np.zeros((221, 371, 3), dtype=np.uint8)
+    for key, display_key, pos in _KEY_LABELS:
         color = (0, 255, 0) if key in keys_down else (100, 100, 100)
-        display_key = key.replace("Key.", "").upper()
-        if key == 'f': display_key = "SHOOT"
-        if key == 'd': display_key = "DASH"
-        cv2.putText(frame, display_key, pos, cv2.FONT_HERSHEY_SIMPLEX, 0.4, color, 2)
+        cv2.putText(canvas, display_key, pos, FONT, 0.4, color, 2)
+    cv2.putText(canvas, "[ / ] to adjust", (200, 200), FONT, 0.4, (255, 255, 255), 1)
+    return canvas[20:, 10:]
+
+def draw_key_state_on_frame(frame, keys_down: frozenset, offset: float, utc_time: float):
+    # Blit the cached tile for this key state (drawn on the decoded frame, no copy)
+    tile = _OVERLAY_TILES.get(keys_down)
+    if tile is None:
+        tile = _OVERLAY_TILES[keys_down] = _render_overlay_tile(keys_down)
+    # Clip like cv2 drawing does, for frames smaller than the overlay
+    region = frame[20:221, 10:371]
+    region[...] = tile[:region.shape[0], :region.shape[1]]
     
     # Draw Debug Info
-    cv2.putText(frame, f"UTC: {utc_time:.2f}", (20, 180), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (200, 200, 200), 1)
-    cv2.putText(frame, f"Offset: {offset:+.2f}s", (20, 200), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 255), 2)
-    cv2.putText(frame, "[ / ] to adjust", (200, 200), cv2.FONT_HERSHEY_SIMPLEX, 0.4, (255, 255, 255), 1)
+    cv2.putText(frame, f"UTC: {utc_time:.2f}", (20, 180), FONT, 0.5, (200, 200, 200), 1)
+    cv2.putText(frame, f"Offset: {offset:+.2f}s", (20, 200), FONT, 0.6, (0, 255, 255), 2)
     return frame
 
+def run_fast_check(video_path: Path, key_index: tuple, frame_timestamps: np.ndarray, out_dir: Path, session_name: str):
+    """
+    Offline check without playback: writes every key-state change to a CSV and
+    saves one overlaid frame (the first with keys down) as a PNG.
+    """
+    times, snapshots = key_index
+    # Snapshot index for every frame in one vectorized lookup (-1 = before any event)
+    snap_idx = np.searchsorted(times, frame_timestamps, side='right') - 1
+
+    def state_at(frame_idx):
+        i = snap_idx[frame_idx]
+        return snapshots[i] if i >= 0 else frozenset()
+
+    transitions = []
+    prev = frozenset()
+    # Only frames where the snapshot index moves can change the state
+    for frame_idx in np.flatnonzero(np.diff(snap_idx, prepend=-1)):
+        keys = state_at(frame_idx)
+        if keys != prev:
+            transitions.append((int(frame_idx), float(frame_timestamps[frame_idx]), keys))
+            prev = keys
+
+    csv_path = out_dir / f"{session_name}_sync_transitions.csv"
+    with open(csv_path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['frame_idx', 'utc', 'keys_down'])
+        for frame_idx, utc, keys in transitions:
+            writer.writerow([frame_idx, f"{utc:.3f}", ' '.join(sorted(keys))])
+
+    cap = cv2.VideoCapture(str(video_path))
+    video_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    print(f"Video frames: {video_frames}, frame timestamps: {len(frame_timestamps)} "
+          f"(difference {video_frames - len(frame_timestamps):+d})")
+    print(f"Wrote {len(transitions)} key-state transitions to {csv_path}")
+
+    snapshot_idx = next((i for i, _, keys in transitions if keys), 0)
+    cap.set(cv2.CAP_PROP_POS_FRAMES, snapshot_idx)
+    ret, frame = cap.read()
+    cap.release()
+    if ret:
+        png_path = out_dir / f"{session_name}_sync_check.png"
+        frame = draw_key_state_on_frame(frame, state_at(snapshot_idx), 0.0, frame_timestamps[snapshot_idx])
+        cv2.imwrite(str(png_path), frame)
+        print(f"Saved overlay snapshot of frame {snapshot_idx} to {png_path}")
+
 def main():
-    session_name = input("Enter session name (e.g. Train_1): ")
+    parser = argparse.ArgumentParser(description="Replay a session with its logged key state overlaid.")
+    parser.add_argument('session', nargs='?', help="session name (prompted for if omitted)")
+    parser.add_argument('--fast', action='store_true',
+                        help="skip playback; write key-state transitions to CSV and one overlay snapshot")
+    args = parser.parse_args()
+
+    session_name = args.session or input("Enter session name (e.g. Train_1): ")
     data_dir = Path("./data/sessions")
     
     # New File Structure
@@ -93,12 +187,17 @@ def main():
     # Load Data
     print("Loading logs...")
     key_timeline = build_key_state_timeline(event_path)
+    key_index = build_snapshot_index(key_timeline)
     frame_timestamps = load_frame_timestamps(frame_path)
     
-    if not frame_timestamps:
+    if len(frame_timestamps) == 0:
         print("CRITICAL: Frame timestamps missing. Cannot sync perfectly.")
         return
 
+    if args.fast:
+        run_fast_check(video_path, key_index, frame_timestamps, data_dir, session_name)
+        return
+
     cap = cv2.VideoCapture(str(video_path))
     fps = cap.get(cv2.CAP_PROP_FPS)
     
@@ -132,7 +231,7 @@ def main():
             current_lookup_time = base_utc + offset
             
             # Get State
-            keys = get_keys_down_at_time(key_timeline, current_lookup_time)
+            keys = get_keys_down_at_time(key_index, current_lookup_time)
             
             # Draw
             frame = draw_key_state_on_frame(frame, keys, offset, base_utc)
@@ -0,0 +1,158 @@
+"""
+Converts cuphead_encoder.keras / cuphead_brain.keras to TFLite for the live agents.
+
+Two models are written (see agent_runtime.streaming_models): the encoder with
+the brain's GRU input projection fused on, run once per frame, and the
+recurrent part of the brain plus its dense head, run on the window of cached
+projections.
+
+    python convert_models.py           # post-training INT8, calibrated on recorded sessions
+    python convert_models.py --fp16    # FP16 weights only, if INT8 is slower on this CPU
+    python convert_models.py --onnx    # INT8 ONNX for onnxruntime (needs tf2onnx, onnxruntime)
+
+Calibration frames are read from the session videos in data/sessions and
+preprocessed exactly like the agents do it, so the INT8 ranges match what the
+models see live. A model that can't be fully integer-quantized (e.g. the GRU)
+falls back to FP16 on its own.
+"""
+import argparse
+import tempfile
+from pathlib import Path
+
+import cv2
+import numpy as np
+import tensorflow as tf
+
+from agent_runtime import (ENCODER_KERAS, BRAIN_KERAS, ENCODER_TFLITE, BRAIN_GRU_TFLITE,
+                           ENCODER_ONNX, BRAIN_GRU_ONNX, NORMALIZE_LUT, streaming_models)
+
+# These MUST match run_agent.py / play_the_game.py
+IMG_HEIGHT = 72
+IMG_WIDTH = 128
+SEQUENCE_LENGTH = 10
+
+SESSIONS_DIR = Path("./data/sessions")
+CALIBRATION_FRAMES = 100
+
+
+def load_calibration_clips(max_frames=CALIBRATION_FRAMES):
+    """
+    Returns a list of clips, each SEQUENCE_LENGTH consecutive preprocessed frames
+    of shape (1, IMG_HEIGHT, IMG_WIDTH, 1), spread evenly over every session video.
+    """
+    videos = sorted(SESSIONS_DIR.glob("*.mp4"))
+    if not videos:
+        raise SystemExit(f"No session videos in {SESSIONS_DIR}, record a session first.")
+
+    clips_per_video = max(1, max_frames // SEQUENCE_LENGTH // len(videos))
+    clips = []
+    for video in videos:
+        cap = cv2.VideoCapture(str(video))
+        total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        if total < SEQUENCE_LENGTH:
+            cap.release()
+            continue
+        for start in np.linspace(0, total - SEQUENCE_LENGTH, clips_per_video, dtype=int):
+            cap.set(cv2.CAP_PROP_POS_FRAMES, int(start))
+            clip = []
+            for _ in range(SEQUENCE_LENGTH):
+                ok, bgr = cap.read()
+                if not ok:
+                    break
+                frame = cv2.cvtColor(bgr, cv2.COLOR_BGR2GRAY)
+                frame = cv2.resize(frame, (IMG_WIDTH, IMG_HEIGHT))
+                clip.append(NORMALIZE_LUT[frame].reshape(1, IMG_HEIGHT, IMG_WIDTH, 1))
+            if len(clip) == SEQUENCE_LENGTH:
+                clips.append(clip)
+        cap.release()
+    if not clips:
+        raise SystemExit("Session videos are too short to calibrate on.")
+    return clips
+
+
+def convert(model, representative, out_path, fp16=False):
+    """Writes model to out_path as full-INT8 TFLite, or FP16 if asked / INT8 fails."""
+    if not fp16:
+        converter = tf.lite.TFLiteConverter.from_keras_model(model)
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = representative
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        converter.inference_input_type = tf.int8
+        converter.inference_output_type = tf.int8
+        try:
+            tflite_model = converter.convert()
+            Path(out_path).write_bytes(tflite_model)
+            print(f"✅ {out_path}: INT8, {len(tflite_model) / 1e6:.1f} MB")
+            return
+        except Exception as e:
+            print(f"⚠️ INT8 conversion of {out_path} failed ({e}), falling back to FP16")
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    converter.target_spec.supported_types = [tf.float16]
+    tflite_model = converter.convert()
+    Path(out_path).write_bytes(tflite_model)
+    print(f"✅ {out_path}: FP16, {len(tflite_model) / 1e6:.1f} MB")
+
+
+def convert_onnx(model, representative, out_path):
+    """Writes model to out_path as static INT8 (QDQ) ONNX, calibrated on representative."""
+    import tf2onnx
+    from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+
+    spec = (tf.TensorSpec((1,) + tuple(model.input_shape[1:]), tf.float32, name='input'),)
+    with tempfile.TemporaryDirectory() as tmp:
+        fp32_path = Path(tmp) / 'model.onnx'
+        tf2onnx.convert.from_keras(model, input_signature=spec, opset=17, output_path=str(fp32_path))
+
+        class Reader(CalibrationDataReader):
+            def __init__(self):
+                self._batches = iter(representative())
+
+            def get_next(self):
+                batch = next(self._batches, None)
+                return None if batch is None else {'input': batch[0]}
+
+        quantize_static(str(fp32_path), out_path, Reader(), quant_format=QuantFormat.QDQ,
+                        activation_type=QuantType.QInt8, weight_type=QuantType.QInt8,
+                        per_channel=True)
+    print(f"✅ {out_path}: INT8 ONNX, {Path(out_path).stat().st_size / 1e6:.1f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert the Keras models to TFLite.")
+    parser.add_argument('--fp16', action='store_true',
+                        help="FP16 weight quantization instead of INT8")
+    parser.add_argument('--onnx', action='store_true',
+                        help="write INT8 ONNX models for onnxruntime instead of TFLite")
+    args = parser.parse_args()
+
+    encoder = tf.keras.models.load_model(ENCODER_KERAS)
+    brain = tf.keras.models.load_model(BRAIN_KERAS)
+
+    clips = load_calibration_clips()
+    print(f"Calibrating on {len(clips) * SEQUENCE_LENGTH} frames from {SESSIONS_DIR}")
+
+    def encoder_data():
+        for clip in clips:
+            for frame in clip:
+                yield [frame]
+
+    # The brain is calibrated on real sequences of encoder outputs
+    encode, recur = streaming_models(encoder, brain)
+    projections = [np.concatenate([encode.predict(f, verbose=0) for f in clip]) for clip in clips]
+
+    def gru_data():
+        for seq in projections:
+            yield [seq.reshape(1, SEQUENCE_LENGTH, -1).astype(np.float32)]
+
+    if args.onnx:
+        convert_onnx(encode, encoder_data, ENCODER_ONNX)
+        convert_onnx(recur, gru_data, BRAIN_GRU_ONNX)
+        return
+
+    convert(encode, encoder_data, ENCODER_TFLITE, fp16=args.fp16)
+    convert(recur, gru_data, BRAIN_GRU_TFLITE, fp16=args.fp16)
+
+if __name__ == "__main__":
+    main()
@@ -1,31 +1,23 @@
-import time
 from pynput import mouse
 
-print("Move your mouse to the TOP-LEFT corner of the game window and wait...")
-time.sleep(5)  # Gives you 5 seconds to position the mouse
+print("Click the TOP-LEFT corner of the game window, then the BOTTOM-RIGHT corner...")
 
-def on_move(x, y):
-    global top_left_x, top_left_y
-    top_left_x, top_left_y = int(x), int(y)
-    # Stop the listener after the first move event
-    return False
+coords = []
 
-with mouse.Listener(on_move=on_move) as listener:
-    listener.join()
-
-print(f"Captured Top-Left: (x={top_left_x}, y={top_left_y})")
-
-print("\nNow, move your mouse to the BOTTOM-RIGHT corner of the game window and wait...")
-time.sleep(5)
+def on_click(x, y, button, pressed):
+    if not pressed:
+        return
+    coords.append((int(x), int(y)))
+    if len(coords) == 1:
+        print(f"Captured Top-Left: (x={coords[0][0]}, y={coords[0][1]})")
+    # Stop the listener after the second click
+    return len(coords) < 2
 
-def on_move(x, y):
-    global bottom_right_x, bottom_right_y
-    bottom_right_x, bottom_right_y = int(x), int(y)
-    return False
-
-with mouse.Listener(on_move=on_move) as listener:
+# One listener for both corners; only clicks are recorded, so moving the mouse is free
+with mouse.Listener(on_click=on_click) as listener:
     listener.join()
-    
+
+(top_left_x, top_left_y), (bottom_right_x, bottom_right_y) = coords
 print(f"Captured Bottom-Right: (x={bottom_right_x}, y={bottom_right_y})")
 
 # Calculate the region for the config
@@ -33,4 +25,4 @@ width = bottom_right_x - top_left_x
 height = bottom_right_y - top_left_y
 
 print("\n--- Paste this into app/main.py ---")
-print(f"self.CAPTURE_REGION = {{'top': {top_left_y}, 'left': {top_left_x}, 'width': {width}, 'height': {height}}}")
\ No newline at end of file
+print(f"self.CAPTURE_REGION = {{'top': {top_left_y}, 'left': {top_left_x}, 'width': {width}, 'height': {height}}}")
@@ -1,9 +1,9 @@
+import ctypes
+import sys
 import cv2
-import mss
 import numpy as np
 import time
-from collections import deque
-from tensorflow.keras.models import load_model
+from agent_runtime import load_models, FramePipeline, quit_on_key
 from pynput.keyboard import Controller, Key # Import the Controller
 
 # --- Keyboard Controller Setup ---
@@ -21,90 +21,174 @@ KEY_MAP = {
     'DASH': 'd',
 }
 ACTIONS = list(KEY_MAP.keys())
+# Action i is bit i of the pressed-key state, and ACTION_KEYS[i] is its key
+ACTION_KEYS = tuple(KEY_MAP[a] for a in ACTIONS)
+ACTION_BITS = 1 << np.arange(len(ACTIONS))
+
+# The same keys as Windows virtual-key codes, and whether each is an extended (arrow) key
+VK_MAP = {
+    'UP': (0x26, True),
+    'DOWN': (0x28, True),
+    'LEFT': (0x25, True),
+    'RIGHT': (0x27, True),
+    'JUMP': (0x20, False),
+    'SHOOT': (ord('F'), False),
+    'DASH': (ord('D'), False),
+}
+
+
+def set_bits(state):
+    """Yields the index of every set bit in state, lowest first."""
+    while state:
+        low = state & -state
+        yield low.bit_length() - 1
+        state ^= low
+
+
+# Optional: a Numba kernel for probabilities -> (state, releases, presses); NumPy is the fallback
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+if njit is not None:
+    @njit(cache=True, nogil=True)
+    def postprocess(probs, state, n_actions):
+        new_state = 0
+        for i in range(n_actions):
+            if probs[i] > 0.5:
+                new_state |= 1 << i
+        changed = state ^ new_state
+        return new_state, changed & state, changed & new_state
+
+    # Compile at import (or load from the on-disk cache) so the first frame does not pay for it
+    postprocess(np.zeros(len(ACTIONS), np.float32), 0, len(ACTIONS))
+else:
+    def postprocess(probs, state, n_actions):
+        new_state = int(ACTION_BITS @ (probs[:n_actions] > 0.5))
+        changed = state ^ new_state
+        return new_state, changed & state, changed & new_state
+
+
+# On Windows all of a frame's key changes go out in one SendInput call; elsewhere pynput sends them
+if sys.platform == 'win32':
+    from ctypes import wintypes
+
+    class _KEYBDINPUT(ctypes.Structure):
+        _fields_ = [('wVk', wintypes.WORD), ('wScan', wintypes.WORD), ('dwFlags', wintypes.DWORD),
+                    ('time', wintypes.DWORD), ('dwExtraInfo', ctypes.c_size_t)]
+
+    class _MOUSEINPUT(ctypes.Structure):
+        _fields_ = [('dx', wintypes.LONG), ('dy', wintypes.LONG), ('mouseData', wintypes.DWORD),
+                    ('dwFlags', wintypes.DWORD), ('time', wintypes.DWORD), ('dwExtraInfo', ctypes.c_size_t)]
+
+    class _INPUTUNION(ctypes.Union):
+        # INPUT is sized by its largest member, so the mouse variant has to be declared too
+        _fields_ = [('ki', _KEYBDINPUT), ('mi', _MOUSEINPUT)]
+
+    class _INPUT(ctypes.Structure):
+        _anonymous_ = ('u',)
+        _fields_ = [('type', wintypes.DWORD), ('u', _INPUTUNION)]
+
+    _INPUT_KEYBOARD, _KEYEVENTF_EXTENDEDKEY, _KEYEVENTF_KEYUP = 1, 0x1, 0x2
+    _user32 = ctypes.WinDLL('user32', use_last_error=True)
+
+    # (virtual key, scan code, flags) per action, and one reusable event slot per possible change
+    ACTION_VK = tuple((vk, _user32.MapVirtualKeyW(vk, 0), _KEYEVENTF_EXTENDEDKEY if extended else 0)
+                      for vk, extended in (VK_MAP[a] for a in ACTIONS))
+    _key_inputs = (_INPUT * (2 * len(ACTIONS)))()
+    for _event in _key_inputs:
+        _event.type = _INPUT_KEYBOARD
+
+    def send_key_changes(releases, presses):
+        """Releases then presses the actions set in the two bitmasks, in one SendInput call."""
+        n = 0
+        for up, state in ((_KEYEVENTF_KEYUP, releases), (0, presses)):
+            for i in set_bits(state):
+                vk, scan, flags = ACTION_VK[i]
+                ki = _key_inputs[n].ki
+                ki.wVk, ki.wScan, ki.dwFlags = vk, scan, flags | up
+                n += 1
+        if n:
+            _user32.SendInput(n, _key_inputs, ctypes.sizeof(_INPUT))
+else:
+    def send_key_changes(releases, presses):
+        """Releases then presses the actions set in the two bitmasks."""
+        for i in set_bits(releases):
+            keyboard.release(ACTION_KEYS[i])
+        for i in set_bits(presses):
+            keyboard.press(ACTION_KEYS[i])
+
 
 # --- Configuration (same as before) ---
 IMG_HEIGHT, IMG_WIDTH = 72, 128
 SEQUENCE_LENGTH = 10
 CAPTURE_REGION = {'top': 289, 'left': 3, 'width': 716, 'height': 401}
 
+# The live view is for humans, so it only refreshes every few frames (~15 Hz at 60 fps)
+WINDOW_NAME = "Cuphead AI - Live View (Press 'q' to quit)"
+DISPLAY_EVERY = 4
+
 # --- Load Models (same as before) ---
 print("Loading trained models...")
 try:
-    encoder = load_model('cuphead_encoder.keras')
-    brain = load_model('cuphead_brain.keras')
+    encoder, brain = load_models(SEQUENCE_LENGTH)
     print("✅ Models loaded successfully.")
 except Exception as e:
     print(f"❌ Error loading models: {e}")
     exit()
 
 # --- Initialize Agent State ---
-latent_vector_sequence = deque(maxlen=SEQUENCE_LENGTH)
-# NEW: Keep track of which keys the AI is currently holding down
-keys_currently_pressed = set()
+# NEW: Keep track of which keys the AI is currently holding down, one bit per action
+keys_currently_pressed = 0
 
 print("\n--- STARTING AI GAMEPLAY ---")
 print("Click on the Cuphead game window NOW.")
 print("The AI will take control in 5 seconds...")
-print("To stop the AI, click the 'Live View' window and press 'q'.")
+print("To stop the AI, press 'q'.")
 time.sleep(5)
 
 # --- Main Agent Loop ---
-with mss.mss() as sct:
-    while True:
-        # 1. See: Grab and process the screen
-        screen_raw = sct.grab(CAPTURE_REGION)
-        img = np.array(screen_raw)
-        frame = cv2.cvtColor(img, cv2.COLOR_BGRA2GRAY)
-        frame = cv2.resize(frame, (IMG_WIDTH, IMG_HEIGHT))
-        frame = frame / 255.0
-        frame_reshaped = frame.reshape(1, IMG_HEIGHT, IMG_WIDTH, 1)
-
+# 1. See: screen grabs are captured and processed on background threads
+quit_requested = quit_on_key('q')
+with FramePipeline(CAPTURE_REGION, (IMG_WIDTH, IMG_HEIGHT)) as frames:
+    for frame_idx, (img, frame_reshaped) in enumerate(frames):
         # 2. Think: Get prediction from models
-        latent_vector = encoder.predict(frame_reshaped, verbose=0)
-        latent_vector_sequence.append(latent_vector)
-
-        predicted_actions_set = set()
-        if len(latent_vector_sequence) == SEQUENCE_LENGTH:
-            sequence_input = np.array(list(latent_vector_sequence)).reshape(1, SEQUENCE_LENGTH, -1)
-            probabilities = brain.predict(sequence_input, verbose=0)[0]
-            
-            for i, prob in enumerate(probabilities):
-                if prob > 0.5:
-                    predicted_actions_set.add(ACTIONS[i])
+        latent_vector = encoder(frame_reshaped)
+        probabilities = brain(latent_vector)
+
+        # Determine which actions are "pressed" based on a 0.5 threshold,
+        # and which of them changed since the last frame
+        if probabilities is not None:
+            predicted_state, releases, presses = postprocess(probabilities, keys_currently_pressed, len(ACTIONS))
+        else:
+            predicted_state, releases, presses = 0, keys_currently_pressed, 0
 
         # 3. Act: Press and release keys to match the prediction
-        # Find keys that need to be released
-        keys_to_release = keys_currently_pressed - predicted_actions_set
-        for key_name in keys_to_release:
-            key_to_press = KEY_MAP[key_name]
-            keyboard.release(key_to_press)
-            # print(f"Released: {key_name}")
-
-        # Find keys that need to be pressed
-        keys_to_press_new = predicted_actions_set - keys_currently_pressed
-        for key_name in keys_to_press_new:
-            key_to_press = KEY_MAP[key_name]
-            keyboard.press(key_to_press)
-            # print(f"Pressed: {key_name}")
+        # Only the actions that changed since the last frame need a key event
+        send_key_changes(releases, presses)
 
         # Update the state of currently pressed keys
-        keys_currently_pressed = predicted_actions_set
-        
-        # 4. Visualize (same as before)
-        display_frame = cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
-        # ... [visualization code is the same] ...
-        cv2.rectangle(display_frame, (5, 5), (200, 30 + (len(ACTIONS) * 25)), (0, 0, 0), -1)
-        if not predicted_actions_set:
-            cv2.putText(display_frame, "IDLE", (15, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (150, 150, 150), 2)
-        else:
-            for i, action in enumerate(sorted(list(predicted_actions_set))):
-                cv2.putText(display_frame, action, (15, 30 + i*25), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
-        cv2.imshow("Cuphead AI - Live View (Press 'q' to quit)", display_frame)
+        keys_currently_pressed = predicted_state
+
+        # 4. Visualize (same as before), throttled and skipped while the window is hidden
+        # (it doesn't exist before the first imshow, so frame 0 always shows)
+        if frame_idx % DISPLAY_EVERY == 0 and (frame_idx == 0 or cv2.getWindowProperty(WINDOW_NAME, cv2.WND_PROP_VISIBLE) >= 1):
+            # Draw straight onto the BGRA grab; imshow takes 4 channels, so no BGR copy is needed
+            display_frame = img
+            cv2.rectangle(display_frame, (5, 5), (200, 30 + (len(ACTIONS) * 25)), (0, 0, 0, 255), -1)
+            if not predicted_state:
+                cv2.putText(display_frame, "IDLE", (15, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (150, 150, 150, 255), 2)
+            else:
+                for i, action in enumerate(sorted(ACTIONS[j] for j in set_bits(predicted_state))):
+                    cv2.putText(display_frame, action, (15, 30 + i*25), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0, 255), 2)
+            cv2.imshow(WINDOW_NAME, display_frame)
+            # Lets HighGUI paint the window; quitting is handled by quit_requested
+            cv2.waitKey(1)
 
-        if cv2.waitKey(1) & 0xFF == ord('q'):
+        if quit_requested.is_set():
             # IMPORTANT: Release all keys before quitting!
-            for key_name in keys_currently_pressed:
-                keyboard.release(KEY_MAP[key_name])
+            send_key_changes(keys_currently_pressed, 0)
             break
 
 cv2.destroyAllWindows()